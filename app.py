@@ -1,3 +1,4 @@
+import functools
 import os
 import sys
 from pathlib import Path
@@ -17,14 +18,21 @@ if str(SRC_ROOT) not in sys.path:
 load_dotenv()
 
 from langchain_core.messages import HumanMessage
-from src.agent import create_agent
+from src.agent import create_agent, stream_agent
 
 
+@functools.lru_cache(maxsize=1)
 def get_trace_link() -> str:
     proj = os.getenv("LANGSMITH_PROJECT", "ai-weather-assistant")
     return f"https://smith.langchain.com/o/~/projects/{proj}"
 
 
+@st.cache_resource(show_spinner="RAG sistemi başlatılıyor, ajan derleniyor…")
+def _get_agent():
+    # Derlenmiş graph tüm oturumlar ve rerun'lar arasında paylaşılır
+    return create_agent()
+
+
 st.set_page_config(page_title="AI Weather Assistant", page_icon="🤖", layout="centered")
 st.title("🤖 AI Weather Assistant")
 st.caption("RAG + OpenWeather + LangGraph • LangSmith Tracing")
@@ -32,19 +40,15 @@ st.caption("RAG + OpenWeather + LangGraph • LangSmith Tracing")
 if "session_id" not in st.session_state:
     st.session_state.session_id = os.getenv("DEFAULT_SESSION_ID") or str(uuid4())
 
-if "agent_app" not in st.session_state:
-    with st.status("RAG sistemi başlatılıyor...", expanded=True) as status:
-        st.write("Ajan derleniyor ve hazır hale getiriliyor…")
-        try:
-            st.session_state.agent_app = create_agent()
-            status.update(label="Sistem hazır ✅", state="complete")
-        except Exception as e:
-            status.update(label="Başlatma hatası ❌", state="error")
-            st.error(f"Ajan başlatılırken hata: {e}")
-            st.stop()
+try:
+    agent_app = _get_agent()
+except Exception as e:
+    st.error(f"Ajan başlatılırken hata: {e}")
+    st.stop()
 
 st.markdown(f"**Session ID**: `{st.session_state.session_id}`  ")
-st.markdown(f"**LangSmith**: [{get_trace_link()}]({get_trace_link()})")
+trace_link = get_trace_link()
+st.markdown(f"**LangSmith**: [{trace_link}]({trace_link})")
 st.divider()
 
 # Chat history using Streamlit chat components
@@ -63,20 +67,16 @@ if user_input:
         st.markdown(user_input)
 
     # Invoke agent
-    app = st.session_state.agent_app
-    state = {
-        "messages": [HumanMessage(content=user_input)],
-        "context": "",
-        "next_action": "rag",
-        "session_id": st.session_state.session_id,
-    }
-    with st.status("Yanıt hazırlanıyor…", expanded=False):
-        out = app.invoke(state, config={"configurable": {"thread_id": st.session_state.session_id}})
-    answer = out["messages"][ -1 ].content
+    app = agent_app
+    # Sadece yeni mesaj gönderilir; geçmiş checkpointer'da (add_messages)
+    state = {"messages": [HumanMessage(content=user_input)], "session_id": st.session_state.session_id}
+    # Yanıt token token gösterilir; memory kaydı akış bittikten sonra yapılır
+    with st.chat_message("assistant"):
+        answer = st.write_stream(
+            stream_agent(app, state, config={"configurable": {"thread_id": st.session_state.session_id}})
+        )
 
     st.session_state.chat.append({"role": "assistant", "content": answer})
-    with st.chat_message("assistant"):
-        st.markdown(answer)
 
 st.info("İpuçları: 'Istanbul'da hava nasıl?', 'API key nasıl alınır?', 'Paris ve London'ın sıcaklıklarını karşılaştır' ")
 
@@ -1,10 +1,20 @@
 from __future__ import annotations
 
+import asyncio
+import contextvars
+import functools
+import hashlib
 import os
+import queue
 import re
 import sys
+import threading
+import weakref
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import TypedDict, List
+from typing import Annotated, List, Iterator
 
 # Ensure project root is on sys.path when running as `python src/agent.py`
 PROJECT_ROOT = Path(__file__).resolve().parents[1]
@@ -12,11 +22,13 @@ if str(PROJECT_ROOT) not in sys.path:
     sys.path.insert(0, str(PROJECT_ROOT))
 
 from dotenv import load_dotenv
-from langchain_openai import ChatOpenAI
-from langchain_core.messages import BaseMessage, HumanMessage, AIMessage
+from langchain_core.messages import BaseMessage, HumanMessage, AIMessage, AIMessageChunk
+from langchain_core.runnables.config import ensure_config
 from langgraph.graph import StateGraph, START, END
+from langgraph.graph.message import add_messages
 from langgraph.checkpoint.memory import MemorySaver
 
+from src.clients import get_llm
 from src.rag import RAGSystem
 from src.tools import get_current_weather
 from src import memory as mem
@@ -25,103 +37,315 @@ from src import memory as mem
 load_dotenv()
 
 
-class AgentState(TypedDict):
-    messages: List[BaseMessage]
-    context: str
-    next_action: str
-    session_id: str
+@dataclass(slots=True)
+class AgentState:
+    # add_messages: yeni mesajlar checkpoint'teki geçmişe eklenir (tüm liste yeniden gönderilmez)
+    messages: Annotated[List[BaseMessage], add_messages] = field(default_factory=list)
+    context: str = ""
+    next_action: str = "rag"
+    session_id: str = ""
 
 
-llm = ChatOpenAI(model=os.getenv("OPENAI_MODEL", "gpt-4o-mini"), temperature=0)
-rag_system: RAGSystem | None = None
+llm = get_llm()
 
+# Aynı soru + bağlam + geçmiş için LLM yanıt cache'i (SHA-256 anahtarlı LRU)
+_RESP_CACHE: OrderedDict[str, str] = OrderedDict()
+_RESP_MAX = 256
 
+
+# Prompt şablonları ve regex'ler import sırasında bir kez hazırlanır
+_CLASSIFY_TMPL = (
+    "Kullanıcı sorusu döküman bilgisi mi gerektiriyor yoksa canlı hava durumu API'si mi?\n"
+    "Sadece şu yanıtlardan birini ver: rag, weather, both.\n\n"
+    "Soru: {q}"
+)
+_CITY_TMPL = (
+    "Aşağıdaki cümlede geçen şehir adını tek kelime olarak döndür.\n"
+    "Sadece şehir adını yaz, başka bir şey yazma.\n"
+    "Metin: {q}"
+)
+_RESPOND_TMPL = (
+    "Aşağıdaki bağlamı ve önceki konuşma geçmişini kullanarak kullanıcıya kısa, net ve Türkçe cevap ver.\n"
+    "Gerektiğinde madde işaretleri ve emoji kullan.\n\n"
+    "[Geçmiş]\n{history}\n\n[Bağlam]\n{context}\n\n[Soru]\n{q}"
+)
+_CITY_RE = re.compile(r"(?:\b(?:in|for|of|de|da)\b|'d[ae])\s+([A-ZİIŞĞÜÖÇ][a-zçıüğöşı]+)", re.UNICODE)
+
+# classify_query ön filtresi: kelime başında eşleşir ("hava" -> "havası", "havasını").
+# Desenler _fold edilmiş metinle eşleşir: "ı" yerine "i" yazılır
+_WEATHER_KW_RE = re.compile(r"\b(?:hava|sicakli|temperature|weather|derece|yağmur|rüzgar|nem\b|kar\b)")
+_DOC_KW_RE = re.compile(r"\b(?:api\b|key\b|endpoint|nasil alinir|döküman|doküman|parametre)")
+
+
+def _fold(text: str) -> str:
+    # "İ" → "i" önce yapılır (aksi halde lower() birleşik nokta bırakır); "I".lower()
+    # "i" verdiğinden "ı" da "i"ye katlanır: "SICAKLIK" ve "sıcaklık" aynı forma iner
+    return text.replace("İ", "i").lower().replace("ı", "i")
+
+
+@functools.lru_cache(maxsize=1)
 def _ensure_rag() -> RAGSystem:
-    global rag_system
-    if rag_system is None:
-        rag_system = RAGSystem()
-    return rag_system
+    # Bloklayan kurulum (Mongo bağlantısı, index kontrolü): coroutine'lerden
+    # asyncio.to_thread ile çağrılır, agent-loop'u durdurmaz
+    return RAGSystem()
+
+
+@functools.lru_cache(maxsize=1)
+def _get_loop() -> asyncio.AbstractEventLoop:
+    # Async client'lar (OpenAI/httpx) tek bir kalıcı event loop'a bağlı kalsın
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, name="agent-loop", daemon=True).start()
+    return loop
+
+
+def run_agent(app, state: dict, config: dict) -> dict:
+    """Async graph'ı senkron çağıranlar (Streamlit, CLI) için ortak loop'ta çalıştır"""
+    return asyncio.run_coroutine_threadsafe(app.ainvoke(state, config=config), _get_loop()).result()
+
+
+def stream_agent(app, state: dict, config: dict) -> Iterator[str]:
+    """run_agent'ın streaming versiyonu: respond_node yanıtını parça parça üretir"""
+    out: queue.Queue = queue.Queue()
+    done = object()
+
+    async def _pump():
+        try:
+            streamed = False
+            final = None
+            async for mode, payload in app.astream(state, config=config, stream_mode=["messages", "values"]):
+                if mode == "messages":
+                    chunk, meta = payload
+                    # Sadece cevap LLM'inin token'ları (classify/şehir çıkarımı hariç).
+                    # Node'un döndürdüğü tam AIMessage da bu modda gelir; tekrar yazılmaz
+                    if (
+                        isinstance(chunk, AIMessageChunk)
+                        and meta.get("langgraph_node") == "respond"
+                        and chunk.content
+                    ):
+                        streamed = True
+                        out.put(chunk.content)
+                else:
+                    final = payload
+            # Yanıt cache'ten geldiyse token akışı olmaz; tamamı tek parça gönderilir
+            if not streamed and final:
+                out.put(final["messages"][-1].content)
+        except BaseException as e:
+            out.put(e)
+        finally:
+            out.put(done)
+
+    asyncio.run_coroutine_threadsafe(_pump(), _get_loop())
+    while (item := out.get()) is not done:
+        if isinstance(item, BaseException):
+            raise item
+        yield item
+
+
+# Eşzamanlı oturumlardan gelen kısa prompt'lar ~10 ms biriktirilip tek abatch ile gönderilir
+_BATCH_WINDOW_S = 0.01
+_BATCH_MAX = 16
+_batchers: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+
+async def _batch_worker(q: asyncio.Queue) -> None:
+    while True:
+        batch = [await q.get()]
+        await asyncio.sleep(_BATCH_WINDOW_S)
+        while not q.empty() and len(batch) < _BATCH_MAX:
+            batch.append(q.get_nowait())
+
+        try:
+            # Her prompt kendi çağıranının config'i (callback/trace/metadata) ile gönderilir
+            results = await llm.abatch(
+                [p for p, _, _ in batch],
+                config=[cfg for _, cfg, _ in batch],
+                return_exceptions=True
+            )
+        except Exception as e:
+            results = [e] * len(batch)
+
+        for (_, _, fut), res in zip(batch, results):
+            if fut.done():  # çağıran iptal edilmiş
+                continue
+            if isinstance(res, BaseException):
+                fut.set_exception(res)
+            else:
+                fut.set_result(res)
+
+
+async def _submit(prompt: str):
+    """llm.ainvoke yerine: prompt'u mevcut loop'un batch kuyruğuna ekle"""
+    loop = asyncio.get_running_loop()
+    if loop not in _batchers:
+        q: asyncio.Queue = asyncio.Queue()
+        # Worker boş context ile başlar: ilk node'un LangGraph config'ini (callback'ler,
+        # thread_id, trace parent) miras alıp sonraki tüm çağrılara taşımaz
+        _batchers[loop] = (q, loop.create_task(_batch_worker(q), context=contextvars.Context()))
+    q, _ = _batchers[loop]
+    fut = loop.create_future()
+    await q.put((prompt, ensure_config(), fut))
+    return await fut
 
 
 # 1) classify_query
-def classify_query(state: AgentState) -> AgentState:
-    user_msg = next((m.content for m in reversed(state["messages"]) if isinstance(m, HumanMessage)), "")
-    prompt = (
-        "Kullanıcı sorusu döküman bilgisi mi gerektiriyor yoksa canlı hava durumu API'si mi?\n"
-        "Sadece şu yanıtlardan birini ver: rag, weather, both.\n\n"
-        f"Soru: {user_msg}"
-    )
-    res = llm.invoke(prompt)
-    label = (res.content or "rag").strip().lower()
+async def _speculative_context(user_msg: str) -> str:
+    # Hata durumunda boş döner; rag_node aramayı tekrar dener
+    try:
+        rag = await asyncio.to_thread(_ensure_rag)
+        return await rag.aget_context_for_query(user_msg, k=3, max_chars=2000)
+    except Exception:
+        return ""
+
+
+def _prefilter_label(user_msg: str) -> str | None:
+    # Açık durumlar anahtar kelimelerle etiketlenir; belirsizse LLM'e bırakılır
+    low = _fold(user_msg)
+    is_weather = bool(_WEATHER_KW_RE.search(low))
+    is_doc = bool(_DOC_KW_RE.search(low))
+    if is_weather and is_doc:
+        return "both"
+    if is_weather:
+        return "weather"
+    if is_doc:
+        return "rag"
+    return None
+
+
+async def classify_query(state: AgentState) -> dict:
+    user_msg = next((m.content for m in reversed(state.messages) if isinstance(m, HumanMessage)), "")
+    label = _prefilter_label(user_msg)
+    if label is not None:
+        # Önceki turdan kalan context sıfırlanır
+        return {"next_action": label, "context": ""}
+
+    prompt = _CLASSIFY_TMPL.format(q=user_msg)
+    # RAG araması sınıflandırma ile paralel (spekülatif) başlatılır
+    rag_task = asyncio.create_task(_speculative_context(user_msg))
+    try:
+        res = await _submit(prompt)
+        label = (res.content or "rag").strip().lower()
+    except BaseException:
+        rag_task.cancel()
+        raise
     if label not in {"rag", "weather", "both"}:
         label = "rag"
-    state["next_action"] = label
-    return state
+
+    if label == "weather":
+        rag_task.cancel()
+        return {"next_action": label, "context": ""}
+    return {"next_action": label, "context": await rag_task}
 
 
 # 2) rag_node
-def rag_node(state: AgentState) -> AgentState:
-    user_msg = next((m.content for m in reversed(state["messages"]) if isinstance(m, HumanMessage)), "")
-    rag = _ensure_rag()
-    context = rag.get_context_for_query(user_msg, k=3, max_chars=2000)
-    state["context"] = context
-    return state
+async def rag_node(state: AgentState) -> dict:
+    if state.context:
+        # classify_query spekülatif aramada context'i zaten doldurdu
+        return {}
+    user_msg = next((m.content for m in reversed(state.messages) if isinstance(m, HumanMessage)), "")
+    rag = await asyncio.to_thread(_ensure_rag)
+    context = await rag.aget_context_for_query(user_msg, k=3, max_chars=2000)
+    return {"context": context}
 
 
 # 3) weather_node
-def _extract_city(question: str) -> str:
-    # Basit LLM destekli çıkarım + regex fallback
-    sys_prompt = (
-        "Aşağıdaki cümlede geçen şehir adını tek kelime olarak döndür.\n"
-        "Sadece şehir adını yaz, başka bir şey yazma.\n"
-        f"Metin: {question}"
-    )
+# Sık sorulan şehirler: normalize ad -> OpenWeather'a gönderilecek ad
+_CITIES = {
+    "istanbul": "Istanbul", "ankara": "Ankara", "izmir": "Izmir", "bursa": "Bursa",
+    "antalya": "Antalya", "adana": "Adana", "konya": "Konya", "gaziantep": "Gaziantep",
+    "kayseri": "Kayseri", "mersin": "Mersin", "eskişehir": "Eskisehir", "eskisehir": "Eskisehir",
+    "diyarbakır": "Diyarbakir", "diyarbakir": "Diyarbakir", "samsun": "Samsun",
+    "trabzon": "Trabzon", "erzurum": "Erzurum", "van": "Van", "malatya": "Malatya",
+    "denizli": "Denizli", "muğla": "Mugla", "mugla": "Mugla", "bodrum": "Bodrum",
+    "edirne": "Edirne", "çanakkale": "Canakkale", "canakkale": "Canakkale",
+    "london": "London", "londra": "London", "paris": "Paris", "berlin": "Berlin",
+    "roma": "Rome", "rome": "Rome", "madrid": "Madrid", "barcelona": "Barcelona",
+    "amsterdam": "Amsterdam", "viyana": "Vienna", "vienna": "Vienna", "atina": "Athens",
+    "athens": "Athens", "moskova": "Moscow", "moscow": "Moscow", "new york": "New York",
+    "tokyo": "Tokyo", "dubai": "Dubai", "bakü": "Baku", "baku": "Baku",
+}
+# Tek derlenmiş alternation; en uzun ad önce denenir, Türkçe ek ('da, 'nın) kabul edilir
+_CITY_MATCH_RE = re.compile(
+    r"\b(" + "|".join(re.escape(c) for c in sorted(_CITIES, key=len, reverse=True)) + r")(?=['’]|\b)"
+)
+
+
+
+def _match_known_city(question: str) -> str | None:
+    m = _CITY_MATCH_RE.search(_fold(question))
+    return _CITIES[m.group(1)] if m else None
+
+
+async def _extract_city(question: str) -> str:
+    # Bilinen şehir listesi + LLM destekli çıkarım + regex fallback
+    known = _match_known_city(question)
+    if known:
+        return known
+
+    sys_prompt = _CITY_TMPL.format(q=question)
     try:
-        out = llm.invoke(sys_prompt).content.strip()
+        out = (await _submit(sys_prompt)).content.strip()
         if out:
             return out.split("\n")[0].strip()
     except Exception:
         pass
 
-    m = re.search(r"in |de |da |'da |'de |\bfor\b|\bof\b|\bin\b\s+([A-ZİIŞĞÜÖ][a-zçıüğöşı]+)", question)
+    m = _CITY_RE.search(question)
     if m:
         return m.group(1)
     return question.strip()
 
 
-def weather_node(state: AgentState) -> AgentState:
-    user_msg = next((m.content for m in reversed(state["messages"]) if isinstance(m, HumanMessage)), "")
-    city = _extract_city(user_msg)
-    weather_text = get_current_weather.invoke(city)
+async def weather_node(state: AgentState) -> dict:
+    user_msg = next((m.content for m in reversed(state.messages) if isinstance(m, HumanMessage)), "")
+    city = await _extract_city(user_msg)
+    # TTL cache tools.get_current_weather içinde
+    weather_text = await get_current_weather.ainvoke(city)
     # Context'e ekle
-    prev = state.get("context", "")
-    state["context"] = (prev + "\n\n" if prev else "") + weather_text
-    return state
+    prev = state.context
+    return {"context": (prev + "\n\n" if prev else "") + weather_text}
 
 
 # 4) respond_node
-def respond_node(state: AgentState) -> AgentState:
-    session_id = state.get("session_id") or os.getenv("DEFAULT_SESSION_ID", "local-dev")
-    history_items = mem.get_conversation_history(session_id, limit=10)
-    history_text = "\n".join([f"{h['role']}: {h['content']}" for h in history_items])
-
-    user_msg = next((m.content for m in reversed(state["messages"]) if isinstance(m, HumanMessage)), "")
-    context = state.get("context", "")
-
-    prompt = (
-        "Aşağıdaki bağlamı ve önceki konuşma geçmişini kullanarak kullanıcıya kısa, net ve Türkçe cevap ver.\n"
-        "Gerektiğinde madde işaretleri ve emoji kullan.\n\n"
-        f"[Geçmiş]\n{history_text}\n\n[Bağlam]\n{context}\n\n[Soru]\n{user_msg}"
+_WRITE_POOL = ThreadPoolExecutor(max_workers=4, thread_name_prefix="memwrite")
+
+
+def _persist_turn(session_id: str, user_msg: str, answer: str) -> None:
+    # Tek task içinde sırayla yazılır: user mesajının timestamp'i her zaman önce olur
+    try:
+        mem.save_message(session_id, "user", user_msg)
+        mem.save_message(session_id, "assistant", answer)
+    except Exception as e:
+        print(f"⚠️ Memory kaydı başarısız ({session_id}): {e}")
+
+
+async def respond_node(state: AgentState) -> dict:
+    session_id = state.session_id or os.getenv("DEFAULT_SESSION_ID", "local-dev")
+    bundle = await asyncio.to_thread(mem.get_context_bundle, session_id, limit=10)
+    history_text = "\n".join(
+        [f"özet: {s['summary']}" for s in bundle["summaries"]]
+        + [f"{h['role']}: {h['content']}" for h in bundle["history"]]
     )
 
-    answer = llm.invoke(prompt).content
+    user_msg = next((m.content for m in reversed(state.messages) if isinstance(m, HumanMessage)), "")
+    context = state.context
+
+    prompt = _RESPOND_TMPL.format(history=history_text, context=context, q=user_msg)
+
+    key = hashlib.sha256(f"{user_msg}|{context}|{history_text}".encode("utf-8")).hexdigest()
+    if key in _RESP_CACHE:
+        _RESP_CACHE.move_to_end(key)
+        answer = _RESP_CACHE[key]
+    else:
+        # Batch'e alınmaz: stream_agent token'ları bu çağrının callback'lerinden okur
+        answer = (await llm.ainvoke(prompt)).content
+        _RESP_CACHE[key] = answer
+        if len(_RESP_CACHE) > _RESP_MAX:
+            _RESP_CACHE.popitem(last=False)
 
-    # Memory kaydet
-    mem.save_message(session_id, "user", user_msg)
-    mem.save_message(session_id, "assistant", answer)
+    # Memory kaydet (arka planda; yanıt Mongo onayını beklemez)
+    _WRITE_POOL.submit(_persist_turn, session_id, user_msg, answer)
 
-    state["messages"].append(AIMessage(content=answer))
-    return state
+    return {"messages": [AIMessage(content=answer)]}
 
 
 def create_agent():
@@ -134,7 +358,7 @@ def create_agent():
 
     workflow.add_conditional_edges(
         "classify",
-        lambda s: s["next_action"],
+        lambda s: s.next_action,
         {"rag": "rag", "weather": "weather", "both": "rag"},
     )
 
@@ -154,13 +378,8 @@ if __name__ == "__main__":
     sid = os.getenv("DEFAULT_SESSION_ID", str(uuid4()))
 
     def run(q: str):
-        state = {
-            "messages": [HumanMessage(content=q)],
-            "context": "",
-            "next_action": "rag",
-            "session_id": sid,
-        }
-        out = app.invoke(state, config={"configurable": {"thread_id": sid}})
+        state = {"messages": [HumanMessage(content=q)], "session_id": sid}
+        out = run_agent(app, state, config={"configurable": {"thread_id": sid}})
         last = out["messages"][-1]
         print(f"\nYou: {q}\n🤖: {last.content}\n")
 
@@ -0,0 +1,53 @@
+import functools
+import os
+
+import httpx
+from dotenv import load_dotenv
+from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+
+try:
+    import h2  # noqa: F401  opsiyonel: HTTP/2 multiplexing (httpx[http2])
+    _HTTP2 = True
+except ImportError:
+    _HTTP2 = False
+
+load_dotenv()
+
+# OpenAI HTTP istemcileri: tek connection pool, HTTP/2 ile tek TLS bağlantı üzerinde paralel istek
+HTTP_TIMEOUT_S = 15
+HTTP_LIMITS = httpx.Limits(max_connections=50, max_keepalive_connections=20)
+
+EMBEDDING_MODEL = "text-embedding-3-small"  # 1536 dimensions
+
+
+@functools.lru_cache(maxsize=1)
+def _http_client() -> httpx.Client:
+    return httpx.Client(http2=_HTTP2, timeout=HTTP_TIMEOUT_S, limits=HTTP_LIMITS)
+
+
+@functools.lru_cache(maxsize=1)
+def _http_async_client() -> httpx.AsyncClient:
+    # Agent async çağrıları tek kalıcı event loop'ta çalışır (agent._get_loop)
+    return httpx.AsyncClient(http2=_HTTP2, timeout=HTTP_TIMEOUT_S, limits=HTTP_LIMITS)
+
+
+@functools.lru_cache(maxsize=1)
+def get_embeddings() -> OpenAIEmbeddings:
+    """Process genelinde paylaşılan OpenAI embeddings istemcisi"""
+    return OpenAIEmbeddings(
+        model=EMBEDDING_MODEL,
+        openai_api_key=os.getenv("OPENAI_API_KEY"),
+        http_client=_http_client(),
+        http_async_client=_http_async_client(),
+    )
+
+
+@functools.lru_cache(maxsize=1)
+def get_llm() -> ChatOpenAI:
+    """Process genelinde paylaşılan chat modeli (OPENAI_MODEL, varsayılan gpt-4o-mini)"""
+    return ChatOpenAI(
+        model=os.getenv("OPENAI_MODEL", "gpt-4o-mini"),
+        temperature=0,
+        http_client=_http_client(),
+        http_async_client=_http_async_client(),
+    )
@@ -1,3 +1,4 @@
+import functools
 import os
 import signal
 import sys
@@ -15,13 +16,14 @@ if str(PROJECT_ROOT) not in sys.path:
     sys.path.insert(0, str(PROJECT_ROOT))
 
 from langsmith import Client as LSClient
-from src.agent import create_agent
+from src.agent import create_agent, run_agent
 from langchain_core.messages import HumanMessage
 
 
 load_dotenv()
 
 
+@functools.lru_cache(maxsize=1)
 def _get_trace_link() -> str:
     try:
         proj = os.getenv("LANGSMITH_PROJECT", "ai-weather-assistant")
@@ -51,14 +53,10 @@ def main():
             rprint("👋 Görüşürüz!")
             break
 
-        state = {
-            "messages": [HumanMessage(content=user)],
-            "context": "",
-            "next_action": "rag",
-            "session_id": session_id,
-        }
+        # Sadece yeni mesaj gönderilir; geçmiş checkpointer'da (add_messages)
+        state = {"messages": [HumanMessage(content=user)], "session_id": session_id}
 
-        out = app.invoke(state, config={"configurable": {"thread_id": session_id}})
+        out = run_agent(app, state, config={"configurable": {"thread_id": session_id}})
         answer = out["messages"][-1].content
         rprint(f"🤖: {answer}")
 
@@ -1,3 +1,4 @@
+import functools
 import os
 import time
 from datetime import datetime, timezone
@@ -5,16 +6,28 @@ from typing import List, Dict, Any
 
 from dotenv import load_dotenv
 from pymongo import MongoClient
+from pymongo.collection import Collection
 
 
 load_dotenv()
 
 
-def _get_mongo() -> MongoClient:
+@functools.lru_cache(maxsize=1)
+def _get_client() -> MongoClient:
+    # Tek bir client (connection pool) tüm çağrılar arasında paylaşılır
     uri = os.getenv("MONGODB_URI")
     if not uri:
         raise ValueError("MONGODB_URI tanımlı değil")
-    return MongoClient(uri)
+    return MongoClient(uri, maxPoolSize=20)
+
+
+@functools.lru_cache(maxsize=1)
+def _get_conversations_col() -> Collection:
+    db = _get_client()[os.getenv("MONGODB_DB_NAME", "weather_assistant")]
+    col = db[os.getenv("MONGODB_COLLECTION_CONVERSATIONS", "conversations")]
+    # Geçmiş sorguları için compound index (idempotent, sadece ilk erişimde)
+    col.create_index([("session_id", 1), ("type", 1), ("timestamp", -1)])
+    return col
 
 
 def _now_iso() -> str:
@@ -23,9 +36,7 @@ def _now_iso() -> str:
 
 # 5.1 Short-term Memory (Conversation History)
 def save_message(session_id: str, role: str, content: str) -> str:
-    client = _get_mongo()
-    db = client[os.getenv("MONGODB_DB_NAME", "weather_assistant")]
-    col = db[os.getenv("MONGODB_COLLECTION_CONVERSATIONS", "conversations")]
+    col = _get_conversations_col()
     doc = {
         "type": "message",
         "session_id": session_id,
@@ -38,23 +49,38 @@ def save_message(session_id: str, role: str, content: str) -> str:
 
 
 def get_conversation_history(session_id: str, limit: int = 10) -> List[Dict[str, Any]]:
-    client = _get_mongo()
-    db = client[os.getenv("MONGODB_DB_NAME", "weather_assistant")]
-    col = db[os.getenv("MONGODB_COLLECTION_CONVERSATIONS", "conversations")]
+    col = _get_conversations_col()
+    # Sunucu sadece son `limit` mesajı döndürür; sonra kronolojik sıraya çevrilir
     cursor = (
-        col.find({"session_id": session_id, "type": "message"})
-        .sort("timestamp", 1)
+        col.find(
+            {"session_id": session_id, "type": "message"},
+            {"_id": 0, "role": 1, "content": 1, "timestamp": 1},
+        )
+        .sort("timestamp", -1)
+        .limit(limit)
     )
     items = list(cursor)
-    if len(items) > limit:
-        items = items[-limit:]
+    items.reverse()
     return [{"role": i["role"], "content": i["content"], "timestamp": i["timestamp"]} for i in items]
 
 
 # 5.2 Context Window Management
+@functools.lru_cache(maxsize=1)
+def _get_encoder():
+    # tiktoken yoksa veya model tanınmıyorsa None (karakter tahminine düşülür)
+    try:
+        import tiktoken
+        return tiktoken.encoding_for_model(os.getenv("OPENAI_MODEL", "gpt-4o-mini"))
+    except Exception:
+        return None
+
+
 def estimate_tokens(text: str) -> int:
-    # Yaklaşık: 4 karakter ≈ 1 token
-    return max(1, int(len(text) / 4))
+    enc = _get_encoder()
+    if enc is None:
+        # Yaklaşık: 4 karakter ≈ 1 token
+        return max(1, int(len(text) / 4))
+    return max(1, len(enc.encode(text)))
 
 
 def manage_context_window(messages: List[Dict[str, str]], max_tokens: int = 4000) -> Dict[str, Any]:
@@ -80,9 +106,7 @@ def manage_context_window(messages: List[Dict[str, str]], max_tokens: int = 4000
 
 # 5.3 Long-term Memory (Conversation Summary)
 def save_summary(session_id: str, summary: str) -> str:
-    client = _get_mongo()
-    db = client[os.getenv("MONGODB_DB_NAME", "weather_assistant")]
-    col = db[os.getenv("MONGODB_COLLECTION_CONVERSATIONS", "conversations")]
+    col = _get_conversations_col()
     doc = {
         "type": "summary",
         "session_id": session_id,
@@ -94,9 +118,7 @@ def save_summary(session_id: str, summary: str) -> str:
 
 
 def get_summaries(session_id: str) -> List[Dict[str, Any]]:
-    client = _get_mongo()
-    db = client[os.getenv("MONGODB_DB_NAME", "weather_assistant")]
-    col = db[os.getenv("MONGODB_COLLECTION_CONVERSATIONS", "conversations")]
+    col = _get_conversations_col()
     cursor = (
         col.find({"session_id": session_id, "type": "summary"})
         .sort("timestamp", 1)
@@ -104,6 +126,33 @@ def get_summaries(session_id: str) -> List[Dict[str, Any]]:
     return [{"summary": i.get("summary", ""), "timestamp": i.get("timestamp", "")} for i in cursor]
 
 
+# 5.4 Tek round-trip ile geçmiş + özetler
+def get_context_bundle(session_id: str, limit: int = 10) -> Dict[str, List[Dict[str, Any]]]:
+    col = _get_conversations_col()
+    pipeline = [
+        {"$match": {"session_id": session_id}},
+        {"$facet": {
+            "history": [
+                {"$match": {"type": "message"}},
+                {"$sort": {"timestamp": -1}},
+                {"$limit": limit},
+                {"$sort": {"timestamp": 1}},
+                {"$project": {"_id": 0, "role": 1, "content": 1, "timestamp": 1}},
+            ],
+            "summaries": [
+                {"$match": {"type": "summary"}},
+                {"$sort": {"timestamp": 1}},
+                {"$project": {"_id": 0, "summary": 1, "timestamp": 1}},
+            ],
+        }},
+    ]
+    result = next(col.aggregate(pipeline), {"history": [], "summaries": []})
+    return {
+        "history": [{"role": i["role"], "content": i["content"], "timestamp": i["timestamp"]} for i in result["history"]],
+        "summaries": [{"summary": i.get("summary", ""), "timestamp": i.get("timestamp", "")} for i in result["summaries"]],
+    }
+
+
 if __name__ == "__main__":
     print("=" * 60)
     print("MEMORY TESTS")
@@ -132,4 +181,7 @@ if __name__ == "__main__":
     summaries = get_summaries(sid)
     print(f"Toplam özet: {len(summaries)}")
 
+    bundle = get_context_bundle(sid, limit=10)
+    print(f"Bundle: {len(bundle['history'])} mesaj, {len(bundle['summaries'])} özet")
+
 
@@ -11,20 +11,168 @@ Bu modül OpenWeatherMap API dökümanlarını:
 LangSmith ile tüm işlemler otomatik trace edilir.
 """
 
+import asyncio
+import functools
+import io
+import itertools
+import json
 import os
+import sys
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 from typing import List
 import dotenv
 
+import numpy as np
+
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_openai import OpenAIEmbeddings
-from langchain_community.vectorstores.mongodb_atlas import MongoDBAtlasVectorSearch
 from langchain_core.documents import Document
 
+from bson import ObjectId
+from bson.binary import VECTOR_SUBTYPE, Binary, BinaryVectorDtype
 from pymongo import MongoClient
+from pymongo.errors import OperationFailure
+from pymongo.operations import SearchIndexModel
+
+# Ensure project root is on sys.path when running as `python src/rag.py`
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from src.clients import get_embeddings
+
+try:
+    import hnswlib  # opsiyonel: büyük semantic cache için ANN index
+except ImportError:
+    hnswlib = None
+
+try:
+    import simsimd  # opsiyonel: yerel arama için SIMD cosine kernel
+except ImportError:
+    simsimd = None
+
+try:
+    import faiss  # opsiyonel: yerel arama için HNSW index
+except ImportError:
+    faiss = None
 
 # Environment variables yükle
 dotenv.load_dotenv()
 
+EMBEDDING_DIM = 1536  # text-embedding-3-small
+
+# Atlas Vector Search (HNSW) index ayarları
+VECTOR_INDEX_NAME = "vector_index"
+
+# HNSW parametre kademeleri: (vektör sayısı üst sınırı, M, ef_construction, ef_search_base)
+HNSW_PARAM_TIERS = (
+    (100_000, 16, 64, 40),
+    (1_000_000, 24, 100, 100),
+    (None, 32, 128, 200),
+)
+
+# Atlas hnswOptions / numCandidates izin verilen aralıkları
+ATLAS_MAX_EDGES_RANGE = (16, 64)
+ATLAS_NUM_EDGE_CANDIDATES_RANGE = (100, 3200)
+ATLAS_NUM_CANDIDATES_MAX = 10000
+
+# $vectorSearch desteklenmiyor hataları (yerel aramaya kalıcı geçiş sadece bunlarda):
+# 40324 = Unrecognized pipeline stage, 31082 = SearchNotEnabled
+VECTOR_SEARCH_UNSUPPORTED_CODES = {40324, 31082}
+
+# Yerel (Atlas dışı) FAISS HNSW index
+FAISS_INDEX_PATH = os.getenv("RAG_FAISS_INDEX_PATH", "data/faiss_index.bin")
+
+# Konsol çıktısı ayraçları (demo / load_documents)
+_EQ = "=" * 70
+_DASH = "─" * 70
+_MINUS = "-" * 70
+
+# get_context_for_query: dökümanlar arası ayraç
+CONTEXT_SEPARATOR = "\n\n---\n\n"
+
+# load_documents: embed_documents istek başına chunk sayısı ve paralel istek sayısı
+EMBED_BATCH_SIZE = 256
+EMBED_WORKERS = 8
+
+# load_documents: insert_many başına döküman sayısı
+INSERT_BATCH_SIZE = 5000
+
+# Wire protocol sıkıştırma (sırayla denenir; zstandard kurulu değilse pymongo uyarı verip zlib kullanır)
+MONGO_COMPRESSORS = "zstd,zlib"
+
+# Yerel arama: embedding tarama cursor'ının batch boyutu
+SCAN_BATCH_SIZE = 1000
+
+# Sorgu metni -> embedding LRU cache boyutu
+EMBED_CACHE_SIZE = 1024
+
+# Semantic cache: benzer sorgular (paraphrase) için hazır context döndürülür
+# (satırlar np.zeros ile ayrılır; bellek sadece dolan satırlar için kullanılır)
+SEMANTIC_CACHE_SIZE = int(os.getenv("RAG_SEMANTIC_CACHE_SIZE", "4096"))
+SEMANTIC_CACHE_THRESHOLD = 0.95
+# Bu kayıt sayısından sonra lineer tarama yerine HNSW index kullanılır (hnswlib varsa);
+# kapasiteye bağlı, küçük cache'lerde de ulaşılabilir
+SEMANTIC_CACHE_HNSW_MIN = min(1000, SEMANTIC_CACHE_SIZE // 2)
+
+# search() sonuç cache'i: random hyperplane LSH (16 bit imza) ile yakın sorgu eşleşmesi
+SEARCH_CACHE_LSH_BITS = 16
+SEARCH_CACHE_BUCKETS = 256
+SEARCH_CACHE_BUCKET_SIZE = 4
+SEARCH_CACHE_THRESHOLD = 0.97
+
+
+def configure_hnsw_params(vector_count: int) -> tuple:
+    """
+    Vektör sayısına göre HNSW parametrelerini seç
+
+    Returns:
+        (m, ef_construction, ef_search_base)
+    """
+    for limit, m, ef_construction, ef_search_base in HNSW_PARAM_TIERS:
+        if limit is None or vector_count < limit:
+            return m, ef_construction, ef_search_base
+
+
+def pack_embedding(vec: np.ndarray) -> Binary:
+    """float32 vektörü BSON BinData vector (subtype 9) olarak paketle; Atlas bu alanı doğrudan index'ler"""
+    # Header: dtype byte + padding byte, ardından little-endian float32 değerler
+    return Binary(
+        BinaryVectorDtype.FLOAT32.value + b"\x00" + np.asarray(vec, dtype="<f4").tobytes(),
+        VECTOR_SUBTYPE
+    )
+
+
+def unpack_embedding(value) -> np.ndarray:
+    """
+    Mongo'dan gelen embedding'i float32 array'e çevir
+
+    BinData vector için np.frombuffer (kopyasız view, 2 byte header atlanır);
+    eski kayıtlardaki double listeleri için np.asarray.
+    """
+    if isinstance(value, bytes):
+        return np.frombuffer(value, dtype="<f4", offset=2)
+    return np.asarray(value, dtype=np.float32)
+
+
+def quantize_int8(v: np.ndarray) -> tuple:
+    """
+    Simetrik int8 quantization (satır başına ölçek)
+
+    Args:
+        v: float vektör [D] veya matris [N, D]
+
+    Returns:
+        (int8 dizi, float32 ölçek) — v ≈ q8 * scale
+    """
+    v = np.asarray(v, dtype=np.float32)
+    scale = np.abs(v).max(axis=-1, keepdims=True) / 127.0
+    scale[scale == 0] = 1.0
+    q8 = np.round(v / scale).astype(np.int8)
+    return q8, scale.squeeze(-1)
+
 
 class RAGSystem:
     """
@@ -35,15 +183,26 @@ class RAGSystem:
         db: MongoDB database
         collection: MongoDB collection (documents)
         embeddings: OpenAI embeddings modeli
-        vectorstore: MongoDB vector store
+        _sem_cache_vecs: Semantic cache sorgu vektörleri (normalize, [N, 1536])
+        _sem_cache_ctx: Semantic cache context metinleri
     """
 
-    def __init__(self):
+    def __init__(
+            self,
+            m: int | None = None,
+            ef_construction: int | None = None,
+            ef_search_base: int | None = None
+    ):
         """
         RAG sistemini başlat
         - MongoDB bağlantısı
         - OpenAI embeddings
-        - Vector store
+        - Atlas vector index ($vectorSearch)
+
+        Args:
+            m: HNSW graph derecesi (None ise vektör sayısına göre seçilir)
+            ef_construction: Index kurulumundaki aday sayısı (None ise otomatik)
+            ef_search_base: Sorgu başına minimum ef (None ise otomatik)
         """
         print("\n🚀 RAG System başlatılıyor...")
 
@@ -58,7 +217,7 @@ class RAGSystem:
             )
 
         try:
-            self.client = MongoClient(mongodb_uri)
+            self.client = MongoClient(mongodb_uri, compressors=MONGO_COMPRESSORS, w=1)
             self.db = self.client["weather_assistant"]
             self.collection = self.db["documents"]
 
@@ -80,32 +239,98 @@ class RAGSystem:
             )
 
         try:
-            self.embeddings = OpenAIEmbeddings(
-                model="text-embedding-3-small",  # 1536 dimensions
-                openai_api_key=openai_key
-            )
+            # Paylaşılan istemci (src/clients.py): agent ile aynı HTTP/2 connection pool
+            self.embeddings = get_embeddings()
             print("✅ OpenAI Embeddings modeli yüklendi")
 
         except Exception as e:
             raise ValueError(f"❌ OpenAI Embeddings hatası: {e}")
 
         # ====================================================================
-        # MongoDB Atlas Vector Search
+        # HNSW parametreleri (verilmeyenler collection boyutuna göre seçilir)
+        # ====================================================================
+        if None in (m, ef_construction, ef_search_base):
+            try:
+                vector_count = self.collection.estimated_document_count()
+            except Exception:
+                vector_count = 0
+            auto_m, auto_efc, auto_efs = configure_hnsw_params(vector_count)
+            m = m or auto_m
+            ef_construction = ef_construction or auto_efc
+            ef_search_base = ef_search_base or auto_efs
+
+        self.m = m
+        self.ef_construction = ef_construction
+        self.ef_search_base = ef_search_base
+        print(f"✅ HNSW: m={m}, efConstruction={ef_construction}, efSearch>={ef_search_base}")
+
+        self._ensure_vector_index()
+
+        # Yerel arama (sadece $vectorSearch yoksa, ilk ihtiyaçta yüklenir)
+        self._use_local_index = False
+        self._local_loaded = False
+        self._emb_matrix = None
+        self._faiss_index = None
+        self._emb_ids: list = []
+        # Yükleme tek thread'de yapılır; alanlar birlikte atanır, _local_loaded en son
+        self._local_lock = threading.Lock()
+        # Thread başına yeniden kullanılan float32 sorgu buffer'ı (_query_buffer)
+        self._q_local = threading.local()
+
+        # ====================================================================
+        # Query Embedding Cache (aynı sorgu tekrar embed edilmez)
         # ====================================================================
+        self._embed_query = functools.lru_cache(maxsize=EMBED_CACHE_SIZE)(self._embed_query_uncached)
+
+        # ====================================================================
+        # Semantic Cache (get_context_for_query)
+        # ====================================================================
+        self._sem_cache_lock = threading.Lock()
+        self._search_cache_lock = threading.Lock()
+        self._lsh_planes = np.random.default_rng(0).standard_normal(
+            (SEARCH_CACHE_LSH_BITS, EMBEDDING_DIM)
+        ).astype(np.float32)
+        self._clear_semantic_cache()
+
+        print("🎉 RAG System başarıyla başlatıldı!\n")
+
+    def _ensure_vector_index(self):
+        """
+        Embedding alanı için Atlas Vector Search (HNSW) index'i yoksa oluştur
+
+        Atlas dışı / yetkisiz ortamlarda sadece uyarı verir; index
+        Atlas arayüzünden de oluşturulabilir (README).
+        """
         try:
-            self.vectorstore = MongoDBAtlasVectorSearch(
-                collection=self.collection,
-                embedding=self.embeddings,
-                index_name="vector_index",  # Atlas'ta oluşturduğumuz index
-                embedding_key="embedding",  # Embedding field adı
-                text_key="text"  # Text field adı
+            existing = {idx["name"] for idx in self.collection.list_search_indexes()}
+            if VECTOR_INDEX_NAME in existing:
+                print(f"✅ Vector index mevcut: {VECTOR_INDEX_NAME}")
+                return
+
+            model = SearchIndexModel(
+                name=VECTOR_INDEX_NAME,
+                type="vectorSearch",
+                definition={
+                    "fields": [{
+                        "type": "vector",
+                        "path": "embedding",
+                        "numDimensions": EMBEDDING_DIM,
+                        "similarity": "cosine",
+                        "hnswOptions": {
+                            "maxEdges": min(max(self.m, ATLAS_MAX_EDGES_RANGE[0]), ATLAS_MAX_EDGES_RANGE[1]),
+                            "numEdgeCandidates": min(
+                                max(self.ef_construction, ATLAS_NUM_EDGE_CANDIDATES_RANGE[0]),
+                                ATLAS_NUM_EDGE_CANDIDATES_RANGE[1]
+                            )
+                        }
+                    }]
+                }
             )
-            print("✅ Vector Store hazır")
+            self.collection.create_search_index(model)
+            print(f"✅ Vector index oluşturuldu: {VECTOR_INDEX_NAME} (m={self.m}, efConstruction={self.ef_construction})")
 
         except Exception as e:
-            raise ValueError(f"❌ Vector Store hatası: {e}")
-
-        print("🎉 RAG System başarıyla başlatıldı!\n")
+            print(f"⚠️  Vector index kontrol edilemedi: {e}")
 
     def load_documents(
             self,
@@ -129,7 +354,7 @@ class RAGSystem:
             Exception: Diğer hatalar
         """
         print(f"\n📥 Dökümanlar yükleniyor: {file_path}")
-        print("-" * 70)
+        print(_MINUS)
 
         # ====================================================================
         # Dosyayı Oku
@@ -188,23 +413,60 @@ class RAGSystem:
         print(f"   Ortalama chunk boyutu: {avg_chunk_size:.0f} karakter")
 
         # ====================================================================
-        # MongoDB'ye Ekle (Embedding otomatik oluşur)
+        # Embedding'ler (tek batch) + MongoDB'ye Ekle
         # ====================================================================
+        print(f"\n🔢 Embedding'ler oluşturuluyor ({len(chunks)} chunk, batch={EMBED_BATCH_SIZE})...")
+
+        try:
+            # Chunk'lar EMBED_BATCH_SIZE'lık gruplar halinde paralel embed edilir (I/O-bound);
+            # ex.map sırayı korur, vektörler chunk sırasıyla birleşir
+            texts = [c.page_content for c in chunks]
+            batches = [texts[i:i + EMBED_BATCH_SIZE] for i in range(0, len(texts), EMBED_BATCH_SIZE)]
+            with ThreadPoolExecutor(max_workers=min(EMBED_WORKERS, len(batches)) or 1) as ex:
+                vectors = np.asarray(
+                    list(itertools.chain.from_iterable(ex.map(self.embeddings.embed_documents, batches))),
+                    dtype=np.float32
+                )
+            # Ingest sırasında normalize: arama tarafında cosine = dot product
+            vectors /= np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12
+        except Exception as e:
+            raise Exception(f"❌ Embedding hatası: {e}")
+
         print(f"\n💾 MongoDB'ye kaydediliyor...")
 
         try:
-            # Her chunk için metadata ekle
-            for i, chunk in enumerate(chunks):
-                chunk.metadata.update({
+            # Ortak metadata bir kez hazırlanır; chunk başına sadece id/boyut eklenir
+            base_meta = doc.metadata
+            # Yerel arama için int8 kopya (4× daha az transfer/RAM); Atlas float32 BinData alanı kullanır
+            vectors_q8, scales = quantize_int8(vectors)
+            docs = [
+                {
+                    "text": text,
+                    "embedding": pack_embedding(vec),
+                    "normalized": True,
+                    "embedding_q8": q8.tobytes(),
+                    "embedding_scale": float(scale),
+                    **base_meta,
                     "chunk_id": i,
-                    "chunk_size": len(chunk.page_content)
-                })
+                    "chunk_size": len(text)
+                }
+                for i, (text, vec, q8, scale) in enumerate(zip(texts, vectors, vectors_q8, scales))
+            ]
 
-            # Vector store'a ekle (embedding'ler otomatik oluşur)
-            ids = self.vectorstore.add_documents(chunks)
+            # Sırasız bulk insert: tek round-trip, bir hata batch'i durdurmaz
+            ids = []
+            for start in range(0, len(docs), INSERT_BATCH_SIZE):
+                result = self.collection.insert_many(
+                    docs[start:start + INSERT_BATCH_SIZE],
+                    ordered=False,
+                    bypass_document_validation=True
+                )
+                ids.extend(result.inserted_ids)
+            self._clear_semantic_cache()
+            self._reset_local_index()
 
             print(f"✅ {len(ids)} döküman MongoDB'ye eklendi")
-            print(f"   Vector Index: vector_index")
+            print(f"   Vector Index: {VECTOR_INDEX_NAME}")
             print(f"   Embedding Boyutu: 1536 (text-embedding-3-small)")
 
             return len(ids)
@@ -216,7 +478,8 @@ class RAGSystem:
             self,
             query: str,
             k: int = 3,
-            score_threshold: float = 0.7
+            score_threshold: float = 0.7,
+            num_candidates: int | None = None
     ) -> List[Document]:
         """
         Sorguya semantically benzer dökümanları ara
@@ -225,22 +488,108 @@ class RAGSystem:
             query: Arama sorgusu
             k: Döndürülecek döküman sayısı
             score_threshold: Minimum benzerlik skoru (0-1)
+            num_candidates: HNSW aday sayısı; None ise ef * k
 
         Returns:
             List of Document objects with similarity scores
         """
         print(f"\n🔍 Arama yapılıyor: '{query}'")
+        try:
+            # 1. katman: aynı sorgu metni -> embedding LRU
+            query_vec = self._embed_query(query)
+        except Exception as e:
+            print(f"❌ Embedding hatası: {e}")
+            return []
+
+        return self.search_with_vector(
+            query_vec, k=k, score_threshold=score_threshold, num_candidates=num_candidates
+        )
+
+    def search_with_vector(
+            self,
+            query_vec,
+            k: int = 3,
+            score_threshold: float = 0.7,
+            num_candidates: int | None = None
+    ) -> List[Document]:
+        """
+        Önceden hesaplanmış sorgu embedding'i ile ara (embed adımı atlanır)
+
+        Args:
+            query_vec: Sorgu embedding'i (ör. embed_documents ile toplu hesaplanmış)
+            k: Döndürülecek döküman sayısı
+            score_threshold: Minimum benzerlik skoru (0-1)
+            num_candidates: HNSW aday sayısı; None ise ef * k
+
+        Returns:
+            List of Document objects with similarity scores
+        """
+        query_vec = np.array(query_vec, dtype=np.float32)
+        query_vec /= np.linalg.norm(query_vec) + 1e-12
+
+        # 2. katman: LSH kovasında cosine > 0.97 olan önceki sorgunun sonuçları
+        params = (k, score_threshold, num_candidates)
+        cached = self._search_cache_lookup(query_vec, params)
+        if cached is not None:
+            print(f"⚡ Search cache hit: {len(cached)} sonuç")
+            return cached
+
+        results = self._search_by_vector(
+            query_vec, k=k, score_threshold=score_threshold, num_candidates=num_candidates
+        )
+        # Hata veya boş sonuç cache'lenmez (benzer sorgular bir sonraki aramada tekrar dener)
+        if not results:
+            return []
+        self._search_cache_store(query_vec, params, results)
+        return results
+
+    def _embed_query_uncached(self, query: str) -> tuple:
+        """OpenAI embed_query çağrısı (hashable tuple, LRU cache için)"""
+        return tuple(self.embeddings.embed_query(query))
+
+    def _search_by_vector(
+            self,
+            query_vec: np.ndarray,
+            k: int = 3,
+            score_threshold: float = 0.7,
+            num_candidates: int | None = None
+    ) -> List[Document] | None:
+        """
+        Önceden hesaplanmış embedding ile Atlas Vector Search ($vectorSearch, HNSW) yap
+
+        Args:
+            query_vec: Normalize float32 sorgu embedding'i
+            k: Döndürülecek döküman sayısı
+            score_threshold: Minimum benzerlik skoru (0-1)
+            num_candidates: HNSW aday sayısı; None ise ef * k
+
+        Returns:
+            List of Document objects with similarity scores; arama hatasında None
+        """
         print(f"   Top-K: {k}")
         print(f"   Score Threshold: {score_threshold}")
 
-        try:
-            # Similarity search with scores
-            docs_with_scores = self.vectorstore.similarity_search_with_score(
-                query,
-                k=k
-            )
+        ef = self._ef_search(k, score_threshold)
 
-            # Filter by score threshold
+        try:
+            # Similarity search with scores (embedding tekrar hesaplanmaz)
+            if self._use_local_index:
+                docs_with_scores = self._local_search(query_vec, k, ef)
+            else:
+                try:
+                    docs_with_scores = self._atlas_search(
+                        query_vec, k, num_candidates or min(ef * k, ATLAS_NUM_CANDIDATES_MAX), score_threshold
+                    )
+                except OperationFailure as e:
+                    # Geçici hatalar (time limit vb.) yukarıda loglanır; kalıcı geçiş yapılmaz
+                    if e.code not in VECTOR_SEARCH_UNSUPPORTED_CODES:
+                        raise
+                    # $vectorSearch yok (Atlas dışı MongoDB): yerel aramaya geç
+                    print(f"⚠️  $vectorSearch desteklenmiyor, yerel arama kullanılıyor: {e}")
+                    self._use_local_index = True
+                    docs_with_scores = self._local_search(query_vec, k, ef)
+
+            # Filter by score threshold (Atlas'ta sunucu tarafında yapıldı; yerel arama için)
             filtered_docs = [
                 (doc, score)
                 for doc, score in docs_with_scores
@@ -260,8 +609,258 @@ class RAGSystem:
 
         except Exception as e:
             print(f"❌ Arama hatası: {e}")
+            return None
+
+    def _ef_search(self, k: int, score_threshold: float) -> int:
+        """Sorgu başına ef: k ve eşik büyüdükçe daha geniş HNSW araması"""
+        return max(self.ef_search_base, 2 * k, int(100 * score_threshold))
+
+    def _atlas_search(
+            self,
+            query_vec: np.ndarray,
+            k: int,
+            num_candidates: int,
+            score_threshold: float = 0.0
+    ) -> List[tuple]:
+        """
+        Atlas $vectorSearch aggregation; (Document, score) listesi döndürür
+
+        Eşik altındaki sonuçlar sunucuda $match ile elenir (transfer/decode edilmez)
+        """
+        pipeline = [
+            {
+                "$vectorSearch": {
+                    "index": VECTOR_INDEX_NAME,
+                    "path": "embedding",
+                    "queryVector": np.asarray(query_vec, dtype=np.float32).tolist(),
+                    "numCandidates": num_candidates,
+                    "limit": k,
+                }
+            },
+            {"$set": {"similarity_score": {"$meta": "vectorSearchScore"}}},
+            {"$match": {"similarity_score": {"$gte": score_threshold}}},
+            {"$project": {"embedding": 0, "embedding_q8": 0}},
+        ]
+
+        docs_with_scores = []
+        for res in self.collection.aggregate(pipeline):
+            text = res.pop("text", "")
+            score = res.pop("similarity_score")
+            docs_with_scores.append((Document(page_content=text, metadata=res), score))
+        return docs_with_scores
+
+    def _reset_local_index(self):
+        """Yerel arama index'ini geçersiz kıl (döküman seti değiştiğinde)"""
+        with self._local_lock:
+            self._local_loaded = False
+            self._emb_matrix = None
+            self._faiss_index = None
+            self._emb_ids = []
+        for path in (FAISS_INDEX_PATH, FAISS_INDEX_PATH + ".ids.json"):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _load_local_index(self):
+        """
+        Yerel arama index'ini hazırla
+
+        Öncelik: FAISS HNSW (diskten veya yeniden kurulur) → SimSIMD int8 matris
+        → normalize edilmiş float32 matris.
+        """
+        with self._local_lock:
+            if self._local_loaded:
+                return  # başka thread yükledi
+
+            index, matrix, ids = self._build_local_index()
+            self._faiss_index, self._emb_matrix, self._emb_ids = index, matrix, ids
+            self._local_loaded = True
+
+    def _build_local_index(self) -> tuple:
+        """Index / matris ve _id listesini hazırla; (faiss_index, matrix, ids) döndürür"""
+        if faiss is not None:
+            loaded = self._load_faiss_index()
+            if loaded is not None:
+                return loaded
+
+        # Sıralama geçişi sadece _id + embedding çeker (text/metadata yok);
+        # satırlar cursor batch'leri geldikçe önceden ayrılmış matrise yazılır.
+        # İçerik top-k seçildikten sonra _local_search'te $in ile alınır.
+        if faiss is None and simsimd is not None and not self.collection.count_documents({"embedding_q8": {"$exists": False}}):
+            matrix = np.empty((self.collection.count_documents({}), EMBEDDING_DIM), dtype=np.int8)
+            ids = []
+            cursor = self.collection.find({}, {"embedding_q8": 1}).batch_size(SCAN_BATCH_SIZE)
+            for d in cursor:
+                if len(ids) == len(matrix):
+                    break  # tarama sırasında eklenen dökümanlar
+                matrix[len(ids)] = np.frombuffer(d["embedding_q8"], dtype=np.int8)
+                ids.append(d["_id"])
+            print(f"✅ Yerel embedding matrisi yüklendi (int8): {len(ids)} döküman")
+            return None, matrix[:len(ids)], ids
+
+        query = {"embedding": {"$exists": True}}
+        matrix = np.empty((self.collection.count_documents(query), EMBEDDING_DIM), dtype=np.float32)
+        ids, needs_norm = [], []
+        cursor = self.collection.find(query, {"embedding": 1, "normalized": 1}).batch_size(SCAN_BATCH_SIZE)
+        for d in cursor:
+            if len(ids) == len(matrix):
+                break  # tarama sırasında eklenen dökümanlar
+            matrix[len(ids)] = unpack_embedding(d["embedding"])
+            ids.append(d["_id"])
+            needs_norm.append(not d.get("normalized", False))
+
+        matrix = matrix[:len(ids)]
+        # Ingest'te normalize edilmiş dökümanlar atlanır (eski kayıtlar için geriye uyum)
+        rows = np.flatnonzero(needs_norm)
+        if rows.size:
+            matrix[rows] /= np.linalg.norm(matrix[rows], axis=1, keepdims=True) + 1e-12
+
+        if faiss is not None:
+            return self._build_faiss_index(matrix, ids), None, ids
+
+        print(f"✅ Yerel embedding matrisi yüklendi: {matrix.shape[0]} döküman")
+        return None, matrix, ids
+
+    def _build_faiss_index(self, matrix: np.ndarray, ids: list) -> "faiss.Index":
+        """Normalize matristen FAISS IndexHNSWFlat (inner product) kur ve diske yaz"""
+        index = faiss.IndexHNSWFlat(EMBEDDING_DIM, self.m, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = self.ef_construction
+        index.add(np.ascontiguousarray(matrix))
+
+        try:
+            os.makedirs(os.path.dirname(FAISS_INDEX_PATH) or ".", exist_ok=True)
+            faiss.write_index(index, FAISS_INDEX_PATH)
+            with open(FAISS_INDEX_PATH + ".ids.json", "w", encoding="utf-8") as f:
+                # HNSW parametreleri ve collection parmak izi (sayı + min/max _id) de saklanır
+                json.dump({
+                    "m": self.m,
+                    "ef_construction": self.ef_construction,
+                    "count": len(ids),
+                    "min_id": str(min(ids)) if ids else None,
+                    "max_id": str(max(ids)) if ids else None,
+                    "ids": [str(i) for i in ids],
+                }, f)
+        except Exception as e:
+            print(f"⚠️  FAISS index diske yazılamadı: {e}")
+
+        print(f"✅ FAISS HNSW index kuruldu: {index.ntotal} döküman")
+        return index
+
+    def _load_faiss_index(self) -> tuple | None:
+        """Diskteki FAISS index'i yükle; (index, None, ids) veya collection ile uyumsuzsa None döndür"""
+        ids_path = FAISS_INDEX_PATH + ".ids.json"
+        if not (os.path.exists(FAISS_INDEX_PATH) and os.path.exists(ids_path)):
+            return None
+
+        try:
+            with open(ids_path, encoding="utf-8") as f:
+                meta = json.load(f)
+            if (meta.get("m"), meta.get("ef_construction")) != (self.m, self.ef_construction):
+                return None
+            # Sayı eşleşmesi yetmez: aynı boyutta yeniden yüklenmiş collection'da _id'ler
+            # değişir. Tüm id'leri $in ile sorgulamak yerine sayı + min/max _id karşılaştırılır
+            # (_id index'i üzerinden iki find_one)
+            if self._collection_fingerprint() != (meta["count"], meta["min_id"], meta["max_id"]):
+                return None
+            ids = [ObjectId(i) for i in meta["ids"]]
+            index = faiss.read_index(FAISS_INDEX_PATH)
+        except Exception as e:
+            print(f"⚠️  FAISS index kullanılamadı, yeniden kurulacak: {e}")
+            return None
+
+        if index.ntotal != len(ids) or index.ntotal != meta["count"]:
+            return None
+
+        print(f"✅ FAISS HNSW index diskten yüklendi: {index.ntotal} döküman")
+        return index, None, ids
+
+    def _collection_fingerprint(self) -> tuple:
+        """Embedding'li dökümanlar için (sayı, min _id, max _id)"""
+        query = {"embedding": {"$exists": True}}
+        first = self.collection.find_one(query, {"_id": 1}, sort=[("_id", 1)])
+        last = self.collection.find_one(query, {"_id": 1}, sort=[("_id", -1)])
+        return (
+            self.collection.count_documents(query),
+            str(first["_id"]) if first else None,
+            str(last["_id"]) if last else None,
+        )
+
+    def _query_buffer(self, query_vec) -> np.ndarray:
+        """
+        Sorguyu thread'e ait float32 buffer'a kopyala ve yerinde normalize et
+
+        Her aramada yeni 6 KB'lık array ayrılmaz; buffer C-contiguous olduğundan
+        FAISS / SimSIMD'e doğrudan verilir. Sadece vektörü çağrı boyunca kullanıp
+        referansını saklamayan yerlerde kullanılır (LSH cache referans sakladığından
+        search_with_vector kendi array'ini ayırır).
+        """
+        buf = getattr(self._q_local, "buf", None)
+        if buf is None:
+            buf = self._q_local.buf = np.empty(EMBEDDING_DIM, dtype=np.float32)
+        np.copyto(buf, query_vec, casting="same_kind")
+        buf /= np.linalg.norm(buf) + 1e-12
+        return buf
+
+    def _local_search(self, query_vec: np.ndarray, k: int, ef: int) -> List[tuple]:
+        """
+        $vectorSearch olmadan yerel top-k arama
+
+        FAISS varsa HNSW graph araması (O(log N)); yoksa brute-force
+        (SimSIMD varsa SIMD kernel). Matris ve sorgu normalize olduğundan
+        cosine = dot product.
+
+        query_vec normalize, C-contiguous float32 olmalıdır (çağıranlar sağlar).
+        Skorlar Atlas cosine skoruyla aynı ölçekte döner: (1 + cos) / 2
+        """
+        if not self._local_loaded:
+            self._load_local_index()
+        # Tutarlı görüntü: reset/yükleme ile yarışmamak için alanlar birlikte okunur
+        with self._local_lock:
+            faiss_index, emb_matrix, emb_ids = self._faiss_index, self._emb_matrix, self._emb_ids
+        n = len(emb_ids)
+        if n == 0:
             return []
 
+        q = query_vec
+        k = min(k, n)
+
+        if faiss_index is not None:
+            # efSearch çağrı başına verilir; paylaşılan index'in ayarı değiştirilmez (thread-safe)
+            scores, labels = faiss_index.search(
+                q.reshape(1, -1), k, params=faiss.SearchParametersHNSW(efSearch=ef)
+            )
+            top = labels[0][labels[0] >= 0]
+            top_cos = scores[0][:len(top)]
+        else:
+            if emb_matrix.dtype == np.int8:
+                # int8 cosine: satır ölçekleri cosine'de sadeleşir, rescale gerekmez
+                q8, _ = quantize_int8(q)
+                cos = 1.0 - np.asarray(simsimd.cdist(q8, emb_matrix, metric="cosine")).ravel()
+            elif simsimd is not None:
+                cos = np.asarray(simsimd.cdist(q, emb_matrix, metric="dot")).ravel()
+            else:
+                cos = emb_matrix @ q
+
+            top = np.argpartition(-cos, k - 1)[:k]
+            top = top[np.argsort(-cos[top])]
+            top_cos = cos[top]
+
+        # Sadece top-k dökümanın içeriği tek sorguda çekilir
+        by_id = {
+            d["_id"]: d
+            for d in self.collection.find(
+                {"_id": {"$in": [emb_ids[i] for i in top]}},
+                {"embedding": 0, "embedding_q8": 0}
+            )
+        }
+        docs_with_scores = []
+        for i, c in zip(top, top_cos):
+            res = by_id.get(emb_ids[i])
+            if res is None:
+                continue
+            text = res.pop("text", "")
+            docs_with_scores.append((Document(page_content=text, metadata=res), float((1.0 + c) / 2)))
+        return docs_with_scores
+
     def get_context_for_query(
             self,
             query: str,
@@ -279,34 +878,191 @@ class RAGSystem:
         Returns:
             Birleştirilmiş context metni
         """
-        docs = self.search(query, k=k)
+        # Sorgu bir kez embed edilir; hem cache hem arama için kullanılır.
+        # Semantic cache vektörü kopyaladığından thread buffer'ı yeterli (yeni array yok)
+        try:
+            query_vec = self._query_buffer(self._embed_query(query))
+        except Exception as e:
+            print(f"❌ Embedding hatası: {e}")
+            return "İlgili döküman bulunamadı."
+
+        cached = self._semantic_cache_lookup(query_vec, k, max_chars)
+        if cached is not None:
+            print(f"⚡ Semantic cache hit: '{query}'")
+            return cached
+
+        print(f"\n🔍 Arama yapılıyor: '{query}'")
+        docs = self._search_by_vector(query_vec, k=k)
 
         if not docs:
             return "İlgili döküman bulunamadı."
 
-        # Dökümanları birleştir
-        context_parts = []
+        # Dökümanları tek buffer'da birleştir
+        buf = io.StringIO()
         total_chars = 0
 
         for i, doc in enumerate(docs, 1):
             doc_text = doc.page_content
+            if i > 1:
+                buf.write(CONTEXT_SEPARATOR)
 
             # Max char limit kontrolü
             if total_chars + len(doc_text) > max_chars:
-                remaining = max_chars - total_chars
-                doc_text = doc_text[:remaining] + "..."
-                context_parts.append(f"[Döküman {i}]\n{doc_text}")
+                buf.write(f"[Döküman {i}]\n{doc_text[:max_chars - total_chars]}...")
                 break
 
-            context_parts.append(f"[Döküman {i}]\n{doc_text}")
+            buf.write(f"[Döküman {i}]\n{doc_text}")
             total_chars += len(doc_text)
 
-        context = "\n\n---\n\n".join(context_parts)
+        context = buf.getvalue()
 
         print(f"📝 Context oluşturuldu: {len(context)} karakter")
 
+        self._semantic_cache_store(query_vec, k, max_chars, context)
         return context
 
+    async def aget_context_for_query(
+            self,
+            query: str,
+            k: int = 3,
+            max_chars: int = 2000
+    ) -> str:
+        """get_context_for_query'nin async versiyonu (event loop'u bloklamaz)"""
+        return await asyncio.to_thread(self.get_context_for_query, query, k, max_chars)
+
+    async def asearch(
+            self,
+            query: str,
+            k: int = 3,
+            score_threshold: float = 0.7,
+            num_candidates: int | None = None
+    ) -> List[Document]:
+        """search'ün async versiyonu: embedding aembed_query ile alınır"""
+        try:
+            query_vec = await self.embeddings.aembed_query(query)
+        except Exception as e:
+            print(f"❌ Embedding hatası: {e}")
+            return []
+        return await self.asearch_with_vector(query_vec, k, score_threshold, num_candidates)
+
+    async def asearch_with_vector(
+            self,
+            query_vec,
+            k: int = 3,
+            score_threshold: float = 0.7,
+            num_candidates: int | None = None
+    ) -> List[Document]:
+        """search_with_vector'ün async versiyonu (pymongo çağrısı thread'de)"""
+        return await asyncio.to_thread(self.search_with_vector, query_vec, k, score_threshold, num_candidates)
+
+    # ========================================================================
+    # Semantic Cache
+    # ========================================================================
+
+    def _clear_semantic_cache(self):
+        """Semantic ve search cache'lerini boşalt (döküman seti değiştiğinde)"""
+        with self._search_cache_lock:
+            self._search_cache: OrderedDict = OrderedDict()
+
+        with self._sem_cache_lock:
+            self._sem_cache_vecs = np.zeros((SEMANTIC_CACHE_SIZE, EMBEDDING_DIM), dtype=np.float32)
+            self._sem_cache_ctx: List[str] = []
+            self._sem_cache_params: List[tuple] = []
+            self._sem_cache_last_used = np.zeros(SEMANTIC_CACHE_SIZE, dtype=np.int64)
+            self._sem_cache_tick = 0
+            self._sem_cache_index = None
+
+    def _lsh_signature(self, query_vec: np.ndarray) -> int:
+        """Random hyperplane imzası: her bit, vektörün bir düzlemin hangi tarafında olduğu"""
+        bits = (self._lsh_planes @ query_vec) > 0
+        return int(bits @ (1 << np.arange(SEARCH_CACHE_LSH_BITS)))
+
+    def _search_cache_lookup(self, query_vec: np.ndarray, params: tuple) -> List[Document] | None:
+        """Aynı LSH kovasında yeterince benzer (cosine > τ) sorgu varsa sonuçlarını döndür"""
+        sig = self._lsh_signature(query_vec)
+        with self._search_cache_lock:
+            bucket = self._search_cache.get(sig)
+            if not bucket:
+                return None
+            for vec, cached_params, docs in bucket:
+                if cached_params == params and float(vec @ query_vec) > SEARCH_CACHE_THRESHOLD:
+                    self._search_cache.move_to_end(sig)
+                    return list(docs)
+            return None
+
+    def _search_cache_store(self, query_vec: np.ndarray, params: tuple, docs: List[Document]):
+        """Sonuçları LSH kovasına ekle (kova ve kova sayısı sınırlı, LRU)"""
+        sig = self._lsh_signature(query_vec)
+        with self._search_cache_lock:
+            bucket = self._search_cache.setdefault(sig, [])
+            bucket.append((query_vec, params, list(docs)))
+            if len(bucket) > SEARCH_CACHE_BUCKET_SIZE:
+                bucket.pop(0)
+            self._search_cache.move_to_end(sig)
+            if len(self._search_cache) > SEARCH_CACHE_BUCKETS:
+                self._search_cache.popitem(last=False)
+
+    def _semantic_cache_lookup(self, query_vec: np.ndarray, k: int, max_chars: int) -> str | None:
+        """
+        Normalize sorgu vektörüne yeterince benzer (cosine ≥ τ) bir kayıt varsa
+        onun context'ini döndür, yoksa None
+        """
+        with self._sem_cache_lock:
+            n = len(self._sem_cache_ctx)
+            if n == 0:
+                return None
+
+            if self._sem_cache_index is not None:
+                # HNSW: O(log N) yakın komşu; sonuçlar mesafeye göre sıralı gelir
+                labels, dists = self._sem_cache_index.knn_query(query_vec, k=min(n, 8))
+                candidates = labels[0][(1.0 - dists[0]) >= SEMANTIC_CACHE_THRESHOLD]
+            else:
+                # float32 BLAS gemv; NumPy'da float16/int8 matmul BLAS'a gitmez ve daha yavaştır
+                scores = self._sem_cache_vecs[:n] @ query_vec
+                hits = np.flatnonzero(scores >= SEMANTIC_CACHE_THRESHOLD)
+                # Sadece eşiği geçen adaylar sıralanır (miss durumunda sıralama yok)
+                candidates = hits[np.argsort(-scores[hits])]
+
+            for idx in candidates:
+                if self._sem_cache_params[idx] == (k, max_chars):
+                    self._sem_cache_tick += 1
+                    self._sem_cache_last_used[idx] = self._sem_cache_tick
+                    return self._sem_cache_ctx[idx]
+            return None
+
+    def _semantic_cache_store(self, query_vec: np.ndarray, k: int, max_chars: int, context: str):
+        """Context'i cache'e ekle; doluysa en uzun süredir kullanılmayanı çıkar (LRU)"""
+        with self._sem_cache_lock:
+            n = len(self._sem_cache_ctx)
+            if n < SEMANTIC_CACHE_SIZE:
+                idx = n
+                self._sem_cache_ctx.append(context)
+                self._sem_cache_params.append((k, max_chars))
+            else:
+                idx = int(np.argmin(self._sem_cache_last_used))
+                self._sem_cache_ctx[idx] = context
+                self._sem_cache_params[idx] = (k, max_chars)
+
+            self._sem_cache_vecs[idx] = query_vec
+            self._sem_cache_tick += 1
+            self._sem_cache_last_used[idx] = self._sem_cache_tick
+
+            if self._sem_cache_index is not None:
+                # Aynı label ile ekleme mevcut elemanı günceller (LRU eviction)
+                self._sem_cache_index.add_items(query_vec.reshape(1, -1), [idx])
+            elif hnswlib is not None and len(self._sem_cache_ctx) >= SEMANTIC_CACHE_HNSW_MIN:
+                self._build_semantic_cache_index()
+
+    def _build_semantic_cache_index(self):
+        """Mevcut cache satırlarından HNSW index kur (lock altında çağrılır)"""
+        n = len(self._sem_cache_ctx)
+        index = hnswlib.Index(space="cosine", dim=EMBEDDING_DIM)
+        index.init_index(max_elements=SEMANTIC_CACHE_SIZE, ef_construction=200, M=16)
+        index.add_items(self._sem_cache_vecs[:n], np.arange(n))
+        index.set_ef(64)
+        self._sem_cache_index = index
+        print(f"⚡ Semantic cache HNSW index'e geçti ({n} kayıt)")
+
     def get_collection_stats(self) -> dict:
         """MongoDB collection istatistiklerini döndür"""
         doc_count = self.collection.count_documents({})
@@ -317,7 +1073,7 @@ class RAGSystem:
         return {
             "total_documents": doc_count,
             "has_embeddings": bool(sample_doc and "embedding" in sample_doc),
-            "embedding_size": len(sample_doc.get("embedding", [])) if sample_doc else 0
+            "embedding_size": len(unpack_embedding(sample_doc.get("embedding", []))) if sample_doc else 0
         }
 
     def clear_collection(self):
@@ -327,6 +1083,8 @@ class RAGSystem:
         ⚠️ DİKKAT: Tüm dökümanları siler!
         """
         result = self.collection.delete_many({})
+        self._clear_semantic_cache()
+        self._reset_local_index()
         print(f"🗑️  {result.deleted_count} döküman silindi")
 
 
@@ -334,12 +1092,27 @@ class RAGSystem:
 # Test ve Demo Fonksiyonu
 # ============================================================================
 
+async def _run_test_queries(rag: RAGSystem, queries: List[str], max_concurrency: int = 10) -> List[List[Document]]:
+    """Demo sorgularını tek batch embedding + eşzamanlı aramalarla çalıştır"""
+    query_vecs = await rag.embeddings.aembed_documents(queries)
+    sem = asyncio.Semaphore(max_concurrency)
+
+    async def _one(query_vec):
+        async with sem:
+            return await rag.asearch_with_vector(query_vec, k=2, score_threshold=0.6)
+
+    return await asyncio.gather(*[_one(v) for v in query_vecs])
+
+
+def _print_header(title: str):
+    """Demo bölüm başlığını tek print ile yazdır"""
+    print(f"\n{_EQ}\n {title}\n{_EQ}")
+
+
 def main():
     """RAG sistemini test et ve demo yap"""
 
-    print("=" * 70)
-    print(" RAG SYSTEM - TEST VE DEMO")
-    print("=" * 70)
+    print(f"{_EQ}\n RAG SYSTEM - TEST VE DEMO\n{_EQ}")
 
     # ====================================================================
     # RAG System Oluştur
@@ -353,9 +1126,7 @@ def main():
     # ====================================================================
     # Collection İstatistikleri
     # ====================================================================
-    print("\n" + "=" * 70)
-    print(" MONGODB COLLECTION İSTATİSTİKLERİ")
-    print("=" * 70)
+    _print_header("MONGODB COLLECTION İSTATİSTİKLERİ")
 
     stats = rag.get_collection_stats()
     print(f"📊 Toplam Döküman: {stats['total_documents']}")
@@ -366,9 +1137,7 @@ def main():
     # Döküman Yükleme (Eğer collection boşsa)
     # ====================================================================
     if stats['total_documents'] == 0:
-        print("\n" + "=" * 70)
-        print(" DÖKÜMAN YÜKLEME")
-        print("=" * 70)
+        _print_header("DÖKÜMAN YÜKLEME")
 
         try:
             chunk_count = rag.load_documents(
@@ -388,9 +1157,7 @@ def main():
     # ====================================================================
     # Test Sorguları
     # ====================================================================
-    print("\n" + "=" * 70)
-    print(" TEST SORGULARI")
-    print("=" * 70)
+    _print_header("TEST SORGULARI")
 
     test_queries = [
         {
@@ -415,20 +1182,20 @@ def main():
         }
     ]
 
-    for i, test in enumerate(test_queries, 1):
-        print(f"\n{'─' * 70}")
+    # Tüm sorgular tek istekle embed edilir, aramalar eşzamanlı çalışır
+    all_docs = asyncio.run(_run_test_queries(rag, [t["query"] for t in test_queries]))
+
+    for i, (test, docs) in enumerate(zip(test_queries, all_docs), 1):
+        print(f"\n{_DASH}")
         print(f"Test {i}: {test['description']}")
-        print(f"{'─' * 70}")
+        print(_DASH)
         print(f"❓ Sorgu: {test['query']}")
 
-        # Arama yap
-        docs = rag.search(test['query'], k=2, score_threshold=0.6)
-
         if docs:
             for j, doc in enumerate(docs, 1):
                 score = doc.metadata.get('similarity_score', 0)
                 print(f"\n📄 Sonuç {j} (Score: {score:.3f})")
-                print("─" * 70)
+                print(_DASH)
                 # İlk 300 karakteri göster
                 content = doc.page_content[:300]
                 print(content)
@@ -440,9 +1207,7 @@ def main():
     # ====================================================================
     # Context Oluşturma Demo
     # ====================================================================
-    print("\n" + "=" * 70)
-    print(" CONTEXT OLUŞTURMA DEMO")
-    print("=" * 70)
+    _print_header("CONTEXT OLUŞTURMA DEMO")
 
     demo_query = "API key nereden alınır ve nasıl kullanılır?"
     print(f"\n❓ Sorgu: {demo_query}")
@@ -454,21 +1219,19 @@ def main():
     )
 
     print("\n📝 Oluşturulan Context:")
-    print("─" * 70)
+    print(_DASH)
     print(context)
 
     # ====================================================================
     # Özet
     # ====================================================================
-    print("\n" + "=" * 70)
-    print(" TEST TAMAMLANDI")
-    print("=" * 70)
+    _print_header("TEST TAMAMLANDI")
     print("✅ RAG sistemi başarıyla çalışıyor!")
     print("✅ Dökümanlar MongoDB'de")
     print("✅ Semantic search çalışıyor")
     print("✅ Context oluşturma hazır")
     print("\n💡 Bir sonraki adım: Weather API tool'u oluştur")
-    print("=" * 70)
+    print(_EQ)
 
 
 if __name__ == "__main__":
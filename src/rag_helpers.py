@@ -4,8 +4,16 @@ RAG sistemi için yardımcı fonksiyonlar
 """
 
 from typing import List
+
+import numpy as np
 from langchain_core.documents import Document
 
+_EQ = "=" * 70
+_DASH = "─" * 70
+
+# format_docs_for_llm: dökümanlar arası ayraç
+DOC_SEPARATOR = f"\n\n{_EQ}\n\n"
+
 
 def format_docs_for_llm(docs: List[Document]) -> str:
     """
@@ -20,18 +28,12 @@ def format_docs_for_llm(docs: List[Document]) -> str:
     if not docs:
         return "İlgili döküman bulunamadı."
 
-    formatted = []
-    for i, doc in enumerate(docs, 1):
-        score = doc.metadata.get('similarity_score', 0)
-        source = doc.metadata.get('source', 'Unknown')
-
-        formatted.append(
-            f"[Döküman {i}] (Relevance: {score:.2f})\n"
-            f"Kaynak: {source}\n\n"
-            f"{doc.page_content}"
-        )
-
-    return "\n\n" + "=" * 70 + "\n\n".join(formatted)
+    return DOC_SEPARATOR.join(
+        f"[Döküman {i}] (Relevance: {doc.metadata.get('similarity_score', 0):.2f})\n"
+        f"Kaynak: {doc.metadata.get('source', 'Unknown')}\n\n"
+        f"{doc.page_content}"
+        for i, doc in enumerate(docs, 1)
+    )
 
 
 def print_search_results(docs: List[Document], query: str):
@@ -42,9 +44,7 @@ def print_search_results(docs: List[Document], query: str):
         docs: Document listesi
         query: Arama sorgusu
     """
-    print(f"\n{'=' * 70}")
-    print(f"🔍 Sorgu: {query}")
-    print(f"{'=' * 70}\n")
+    print(f"\n{_EQ}\n🔍 Sorgu: {query}\n{_EQ}\n")
 
     if not docs:
         print("❌ Sonuç bulunamadı\n")
@@ -57,7 +57,7 @@ def print_search_results(docs: List[Document], query: str):
         print(f"📄 Sonuç {i}")
         print(f"   Score: {score:.3f}")
         print(f"   Chunk ID: {chunk_id}")
-        print(f"   {'─' * 70}")
+        print(f"   {_DASH}")
         print(f"   {doc.page_content[:200]}...")
         print()
 
@@ -81,13 +81,14 @@ def calculate_rag_metrics(docs: List[Document]) -> dict:
             "avg_length": 0
         }
 
-    scores = [doc.metadata.get('similarity_score', 0) for doc in docs]
-    lengths = [len(doc.page_content) for doc in docs]
+    n = len(docs)
+    scores = np.fromiter((doc.metadata.get('similarity_score', 0) for doc in docs), dtype=np.float64, count=n)
+    lengths = np.fromiter((len(doc.page_content) for doc in docs), dtype=np.int64, count=n)
 
     return {
-        "num_results": len(docs),
-        "avg_score": sum(scores) / len(scores),
-        "min_score": min(scores),
-        "max_score": max(scores),
-        "avg_length": sum(lengths) / len(lengths)
+        "num_results": n,
+        "avg_score": float(scores.mean()),
+        "min_score": float(scores.min()),
+        "max_score": float(scores.max()),
+        "avg_length": float(lengths.mean())
     }
\ No newline at end of file
@@ -1,8 +1,17 @@
 import os
+import sys
+from pathlib import Path
+
 from dotenv import load_dotenv
-from langchain_openai import ChatOpenAI, OpenAIEmbeddings
 from langsmith import Client
 
+# Ensure project root is on sys.path when running as `python src/test_apis.py`
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from src.clients import get_embeddings, get_llm
+
 # Environment variables'ı yükle
 load_dotenv()
 
@@ -40,12 +49,8 @@ print("\n🤖 TEST 2: OpenAI Chat API")
 print("-" * 70)
 
 try:
-    # ChatOpenAI instance oluştur
-    llm = ChatOpenAI(
-        model="gpt-4o-mini",
-        temperature=0,
-        openai_api_key=os.getenv("OPENAI_API_KEY")
-    )
+    # Paylaşılan ChatOpenAI instance (src/clients.py)
+    llm = get_llm()
 
     # Basit bir test sorusu
     response = llm.invoke("Merhaba! 2+2 kaç eder?")
@@ -66,11 +71,8 @@ print("\n🔢 TEST 3: OpenAI Embeddings API")
 print("-" * 70)
 
 try:
-    # Embeddings instance oluştur
-    embeddings = OpenAIEmbeddings(
-        model="text-embedding-3-small",
-        openai_api_key=os.getenv("OPENAI_API_KEY")
-    )
+    # Paylaşılan Embeddings instance (src/clients.py)
+    embeddings = get_embeddings()
 
     # Test metni
     test_text = "Hava durumu nasıl?"
@@ -1,14 +1,47 @@
 import os
+import threading
 import time
 from typing import Optional
 
 import requests
+from cachetools import TTLCache
 from dotenv import load_dotenv
 from langchain_core.tools import tool
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import orjson  # hızlı JSON parse (opsiyonel)
+except ImportError:
+    orjson = None
 
 
 load_dotenv()
 
+# Keep-alive bağlantı havuzu: her çağrıda yeni TCP/TLS bağlantısı açılmaz
+_SESSION = requests.Session()
+_ADAPTER = HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=8,
+    # Son yanıt yine döner (raise_on_status=False) ki 429/5xx aşağıda ele alınsın
+    max_retries=Retry(total=2, backoff_factor=0.1, status_forcelist=[429, 500, 502, 503, 504], raise_on_status=False),
+)
+_SESSION.mount("http://", _ADAPTER)
+_SESSION.mount("https://", _ADAPTER)
+
+# Hava durumu ~10 dk'da bir değişir: normalize şehir adı -> formatlanmış çıktı
+_WEATHER_CACHE: TTLCache = TTLCache(maxsize=256, ttl=600)
+_LOCK = threading.Lock()
+
+_WEATHER_EMOJI = {
+    "Thunderstorm": "⛈️",
+    "Drizzle": "🌦️",
+    "Rain": "🌧️",
+    "Snow": "❄️",
+    "Clear": "☀️",
+    "Clouds": "☁️",
+}
+
 
 def _format_weather_output(data: dict) -> str:
     name = data.get("name") or data.get("sys", {}).get("country", "")
@@ -16,44 +49,38 @@ def _format_weather_output(data: dict) -> str:
     main = data.get("main", {})
     wind = data.get("wind", {})
 
-    emoji = {
-        "Thunderstorm": "⛈️",
-        "Drizzle": "🌦️",
-        "Rain": "🌧️",
-        "Snow": "❄️",
-        "Clear": "☀️",
-        "Clouds": "☁️",
-    }.get(weather.get("main", ""), "🌍")
-
-    lines = [
-        f"{emoji} {name} Hava Durumu",
-        "━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━",
-        f"Açıklama: {weather.get('description', '').capitalize()}",
-        f"Sıcaklık: {main.get('temp', 'N/A')}°C (Hissedilen: {main.get('feels_like', 'N/A')}°C)",
-        f"Nem: {main.get('humidity', 'N/A')}%",
-        f"Rüzgar: {wind.get('speed', 'N/A')} m/s",
-        f"Basınç: {main.get('pressure', 'N/A')} hPa",
-    ]
+    emoji = _WEATHER_EMOJI.get(weather.get("main", ""), "🌍")
+
+    # Tek f-string: ara liste / join yok
+    out = (
+        f"{emoji} {name} Hava Durumu\n"
+        "━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━\n"
+        f"Açıklama: {weather.get('description', '').capitalize()}\n"
+        f"Sıcaklık: {main.get('temp', 'N/A')}°C (Hissedilen: {main.get('feels_like', 'N/A')}°C)\n"
+        f"Nem: {main.get('humidity', 'N/A')}%\n"
+        f"Rüzgar: {wind.get('speed', 'N/A')} m/s\n"
+        f"Basınç: {main.get('pressure', 'N/A')} hPa"
+    )
 
     if "visibility" in data:
-        lines.append(f"Görüş: {int(data['visibility'])/1000:.1f} km")
+        out += f"\nGörüş: {int(data['visibility'])/1000:.1f} km"
 
     sys = data.get("sys", {})
     if sys.get("sunrise") and sys.get("sunset"):
         try:
             sunrise = time.strftime("%H:%M", time.localtime(sys["sunrise"]))
             sunset = time.strftime("%H:%M", time.localtime(sys["sunset"]))
-            lines.append(f"Gündoğumu/Günbatımı: {sunrise} / {sunset}")
+            out += f"\nGündoğumu/Günbatımı: {sunrise} / {sunset}"
         except Exception:
             pass
 
-    return "\n".join(lines)
+    return out
 
 
 def _call_openweather(city: str, api_key: str, timeout: Optional[float]) -> dict:
     base_url = "http://api.openweathermap.org/data/2.5/weather"
     params = {"q": city, "appid": api_key, "units": "metric", "lang": "tr"}
-    resp = requests.get(base_url, params=params, timeout=timeout)
+    resp = _SESSION.get(base_url, params=params, timeout=timeout)
 
     if resp.status_code == 401:
         raise PermissionError("OpenWeather API key geçersiz (401). .env içindeki OPENWEATHER_API_KEY'i kontrol et.")
@@ -63,6 +90,8 @@ def _call_openweather(city: str, api_key: str, timeout: Optional[float]) -> dict
         raise RuntimeError("OpenWeather rate limit aşıldı (429). Lütfen daha sonra tekrar deneyin.")
 
     resp.raise_for_status()
+    if orjson is not None:
+        return orjson.loads(resp.content)
     return resp.json()
 
 
@@ -81,11 +110,21 @@ def get_current_weather(city: str) -> str:
     if not api_key:
         return "❌ OPENWEATHER_API_KEY tanımlı değil. .env dosyanızı doldurun."
 
+    key = city.strip().lower()
+    with _LOCK:
+        cached = _WEATHER_CACHE.get(key)
+    if cached is not None:
+        return cached
+
     timeout_s = float(os.getenv("REQUEST_TIMEOUT_SECONDS", "15"))
 
     try:
         data = _call_openweather(city=city, api_key=api_key, timeout=timeout_s)
-        return _format_weather_output(data)
+        output = _format_weather_output(data)
+        # Sadece başarılı yanıtlar cache'lenir; hatalar bir sonraki çağrıda tekrar denenir
+        with _LOCK:
+            _WEATHER_CACHE[key] = output
+        return output
     except requests.Timeout:
         return "⏱️ OpenWeather isteği zaman aşımına uğradı. Biraz sonra tekrar deneyin."
     except PermissionError as e: